@@ -1,8 +1,6 @@
 import pandas as pd
 import streamlit as st
 from pathlib import Path
-from src.model import SimParams, simulate_inventory_po
-import numpy as np
 
 # -------------------------
 # Page config
@@ -18,50 +16,114 @@ st.caption("This app uses masked data only. No proprietary Franklin Sports data
 BASE_DIR = Path(__file__).parent
 DATA_PATH = BASE_DIR / "data" / "masked_merged_sample.csv"
 
-df = pd.read_csv(DATA_PATH)
+
+def data_version(path: str) -> str:
+    """Modification stamp of the file load_data reads; part of every cache key."""
+    pq_path = Path(path).with_suffix(".parquet")
+    src = pq_path if pq_path.exists() else Path(path)
+    return str(src.stat().st_mtime_ns)
+
+
+@st.cache_data
+def load_data(path: str, version: str = "") -> pd.DataFrame:
+    # `version` is only a cache key, so a regenerated data file is re-read
+    # Prefer the typed Parquet copy written by mask_data.py when it exists
+    pq_path = Path(path).with_suffix(".parquet")
+    if pq_path.exists():
+        df = pd.read_parquet(pq_path, engine="pyarrow")
+    else:
+        # Arrow's multi-threaded reader; string columns stay Arrow-backed instead of object dtype
+        df = pd.read_csv(path, engine="pyarrow", dtype_backend="pyarrow")
+    # Low-cardinality labels as categoricals: int-code comparisons, tiny unique()
+    for c in ("division", "taxonomy", "product"):
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    # Week order per ASIN is fixed here once, so the simulation never re-sorts
+    sort_cols = ["asin"] + (["start_date_pred"] if "start_date_pred" in df.columns else [])
+    df = df.sort_values(sort_cols, kind="stable")
+    # Index by ASIN so per-product lookups are a hash probe instead of a full scan
+    return df.set_index("asin", drop=False)
+
+
+@st.cache_data
+def unique_sorted(df: pd.DataFrame, col: str) -> list:
+    s = df[col]
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Categories are already unique; just drop the ones absent from this slice
+        return s.cat.remove_unused_categories().cat.categories.sort_values().tolist()
+    return sorted(s.dropna().unique().tolist())
+
+
+@st.cache_data
+def taxonomies_for(df: pd.DataFrame, division: str) -> list:
+    if division != "All":
+        df = df.loc[df["division"].eq(division)]
+    return unique_sorted(df, "taxonomy")
+
+
+@st.cache_data(max_entries=256)
+def cached_sim(
+    asin: str,
+    horizon: int,
+    lead: int,
+    review: int,
+    sl: float,
+    sf: float,
+    n: int,
+    version: str,
+) -> dict:
+    """Memoized simulate_inventory_po, keyed on the ASIN, the settings and the data version."""
+    # Imported on first run: src.model pulls in numba, which the first page paint doesn't need
+    from src.model import SimParams, simulate_inventory_po
+
+    df_asin = load_data(str(DATA_PATH), version).loc[[asin]]
+    params = SimParams(
+        horizon_weeks=horizon,
+        lead_time_weeks=lead,
+        review_period_weeks=review,
+        service_level=sl,
+        safety_factor=sf,
+        num_sims=n
+    )
+    return simulate_inventory_po(df_asin, params)
+
+
+DATA_VERSION = data_version(str(DATA_PATH))
+df = load_data(str(DATA_PATH), DATA_VERSION)
 
 # -------------------------
 # Sidebar: product selection
 # -------------------------
 st.sidebar.header("1️⃣ Select product")
 
-filtered_df = df.copy()
+filtered_df = df
+division = taxonomy = "All"
 
 if "division" in df.columns:
-    division = st.sidebar.selectbox(
-        "Division", ["All"] + sorted(df["division"].dropna().unique().tolist())
-    )
+    division = st.sidebar.selectbox("Division", ["All"] + unique_sorted(df, "division"))
     if division != "All":
-        filtered_df = filtered_df[filtered_df["division"] == division]
+        filtered_df = filtered_df.loc[filtered_df["division"].eq(division)]
 
 if "taxonomy" in df.columns:
-    taxonomy = st.sidebar.selectbox(
-        "Taxonomy", ["All"] + sorted(filtered_df["taxonomy"].dropna().unique().tolist())
-    )
+    if "division" in df.columns:
+        taxonomy_options = taxonomies_for(df, division)
+    else:
+        taxonomy_options = unique_sorted(df, "taxonomy")
+    taxonomy = st.sidebar.selectbox("Taxonomy", ["All"] + taxonomy_options)
     if taxonomy != "All":
-        filtered_df = filtered_df[filtered_df["taxonomy"] == taxonomy]
+        filtered_df = filtered_df.loc[filtered_df["taxonomy"].eq(taxonomy)]
 
-asin_list = sorted(filtered_df["asin"].dropna().unique().tolist())
+asin_list = unique_sorted(filtered_df, "asin")
 selected_asin = st.sidebar.selectbox("ASIN", asin_list)
 
-selected_row = filtered_df[filtered_df["asin"] == selected_asin].iloc[0]
-
-# -------------------------
-# Sidebar: simulation controls
-# -------------------------
-st.sidebar.divider()
-st.sidebar.header("2️⃣ Simulation controls")
-
-horizon_weeks = st.sidebar.slider("Forecast horizon (weeks)", 4, 52, 26, step=1)
-lead_time_weeks = st.sidebar.slider("Lead time (weeks)", 1, 20, 8, step=1)
-review_period_weeks = st.sidebar.slider("Review period (weeks)", 1, 8, 1, step=1)
-
-service_level = st.sidebar.slider("Service level (%)", 80, 99, 95, step=1)
-safety_factor = st.sidebar.slider("Safety stock factor (multiplier)", 0.0, 3.0, 1.0, step=0.1)
-
-num_sims = st.sidebar.selectbox("Monte Carlo simulations", [100, 250, 500, 1000], index=1)
-
-run = st.sidebar.button("▶ Run simulation", type="primary")
+# Slice the selected ASIN once per selection and reuse it across reruns.
+# An ASIN can span several forecast rows; the first one feeds the summary tiles.
+asin_key = (DATA_VERSION, division, taxonomy, selected_asin)
+if st.session_state.get("asin_slice_key") != asin_key:
+    st.session_state["asin_slice_key"] = asin_key
+    st.session_state["asin_slice"] = filtered_df.loc[[selected_asin]]
+asin_slice = st.session_state["asin_slice"]
+selected_row = asin_slice.iloc[0]
 
 # -------------------------
 # Main: product summary
@@ -84,24 +146,42 @@ if "amazon_url" in selected_row and pd.notna(selected_row.get("amazon_url")):
 st.divider()
 
 # -------------------------
-# Results section (placeholder for now)
+# Results section
 # -------------------------
-st.subheader("Simulation Results")
+# Runs as a fragment: moving a simulation control or clicking Run only reruns
+# this block, not the data load, sidebar filters and product summary above.
+@st.fragment
+def render_results(selected_asin: str) -> None:
+    st.subheader("Simulation controls")
 
-else:
-    params = SimParams(
-        horizon_weeks=horizon_weeks,
-        lead_time_weeks=lead_time_weeks,
-        review_period_weeks=review_period_weeks,
-        service_level=service_level / 100.0,
-        safety_factor=safety_factor,
-        num_sims=num_sims
-    )
+    c1, c2 = st.columns(2)
+    horizon_weeks = c1.slider("Forecast horizon (weeks)", 4, 52, 26, step=1)
+    lead_time_weeks = c1.slider("Lead time (weeks)", 1, 20, 8, step=1)
+    review_period_weeks = c1.slider("Review period (weeks)", 1, 8, 1, step=1)
 
-    df_asin = filtered_df[filtered_df["asin"] == selected_asin].copy()
+    service_level = c2.slider("Service level (%)", 80, 99, 95, step=1)
+    safety_factor = c2.slider("Safety stock factor (multiplier)", 0.0, 3.0, 1.0, step=0.1)
+    num_sims = c2.selectbox("Monte Carlo simulations", [100, 250, 500, 1000], index=1)
+
+    run = st.button("▶ Run simulation", type="primary")
+
+    st.subheader("Simulation Results")
+
+    if not run:
+        st.info("Set the simulation controls above and click **Run simulation**.")
+        return
 
     try:
-        out = simulate_inventory_po(df_asin, params)
+        out = cached_sim(
+            selected_asin,
+            horizon_weeks,
+            lead_time_weeks,
+            review_period_weeks,
+            service_level / 100.0,
+            safety_factor,
+            num_sims,
+            DATA_VERSION,
+        )
         st.success("Simulation ran successfully ✅")
 
         r1, r2, r3 = st.columns(3)
@@ -117,3 +197,6 @@ else:
 
     except Exception as e:
         st.error(f"Simulation failed: {e}")
+
+
+render_results(selected_asin)
@@ -3,62 +3,118 @@ import re
 import hashlib
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+
+try:
+    import polars as pl
+    import fastexcel  # noqa: F401  (engine behind pl.read_excel)
+except ImportError:  # polars is optional; pandas + openpyxl read the workbook instead
+    pl = None
 
 # ---------------------------
 # CONFIG (edit only paths)
 # ---------------------------
 # Your REAL data (stays private, never pushed)
 REAL_INPUT_PATH = "../data_private/inputs/merged_final_verified.xlsx"
+# Tip: save a .parquet copy next to the .xlsx once; it is then streamed in
+# batches instead of loading the whole workbook.
+BATCH_SIZE = 5000
 
 # Output MASKED CSV (safe for GitHub)
 OUT_DIR = "./data"
 OUT_FILE = "masked_merged_sample.csv"   # keep it generic
+OUT_PARQUET_FILE = "masked_merged_sample.parquet"  # typed copy the app loads first
 
 # How many rows to keep in masked sample (small + safe)
 N_SAMPLE_ROWS = 300
 
-# Random seed for reproducibility
+# Random seed for reproducibility. Every load path (Parquet stream, Polars,
+# pandas/openpyxl) samples via sample_positions(), so the same SEED keeps the
+# same rows whichever optional packages are installed.
 SEED = 42
-np.random.seed(SEED)
+rng = np.random.default_rng(SEED)
 
 # ---------------------------
 # HELPERS
 # ---------------------------
+_sha256 = hashlib.sha256  # bound once; skips the module attribute lookup per value
+
 def stable_token(value: str, prefix: str, n: int = 6) -> str:
     """Create stable anonymized token like ASIN_ABC123."""
     s = str(value)
-    h = hashlib.sha256(s.encode("utf-8")).hexdigest().upper()
+    h = _sha256(s.encode("utf-8")).hexdigest().upper()
     return f"{prefix}_{h[:n]}"
 
-def mask_id_column(series: pd.Series, prefix: str) -> pd.Series:
-    return series.astype(str).map(lambda x: stable_token(x, prefix))
+def mask_id_column(series: pd.Series, prefix: str, n: int = 6) -> pd.Series:
+    # Hash each distinct ID once (IDs repeat across weeks), then expand by code
+    codes, uniques = pd.factorize(series.astype(str), use_na_sentinel=False)
+    tokens = np.array([stable_token(u, prefix, n) for u in uniques], dtype=object)
+    return pd.Series(tokens[codes], index=series.index)
 
 def shift_dates(series: pd.Series, shift_days: int = 365) -> pd.Series:
     s = pd.to_datetime(series, errors="coerce")
     return s + pd.to_timedelta(shift_days, unit="D")
 
-def perturb_numeric(series: pd.Series, scale: float = 0.75, noise_pct: float = 0.08) -> pd.Series:
+def perturb_numeric(values: np.ndarray, rng: np.random.Generator, scale: float = 0.75, noise_pct: float = 0.08) -> np.ndarray:
     """
     Multiply by a scale and add mild noise. Keeps shape but hides exact values.
+    Works on the whole (rows, cols) block at once with a single noise draw.
     """
-    s = pd.to_numeric(series, errors="coerce")
-    noise = np.random.normal(loc=0.0, scale=noise_pct, size=len(s))
-    out = s * scale * (1 + noise)
-    return out
+    noise = rng.standard_normal(values.shape) * noise_pct
+    return values * scale * (1.0 + noise)
+
+def sample_positions(n_rows: int, n: int, seed: int) -> np.ndarray:
+    """Row positions (ascending) of the n smallest seeded random keys, one key per row."""
+    if n_rows <= n:
+        return np.arange(n_rows)
+    keys = np.random.default_rng(seed).random(n_rows)
+    return np.sort(np.argpartition(keys, n - 1)[:n])
 
-def clamp_nonnegative(series: pd.Series) -> pd.Series:
-    return series.clip(lower=0)
+def load_sample(path: str, n: int, seed: int) -> pd.DataFrame:
+    """
+    Load a uniform random sample of n rows, so masking only runs on rows we keep.
+    A .parquet sibling of `path` is streamed batch by batch (keep the n smallest
+    random keys seen so far, the same keys sample_positions draws); otherwise the
+    Excel file is read and sampled at once, with Polars' Rust reader when polars
+    (+ fastexcel) is installed.
+    """
+    pq_path = os.path.splitext(path)[0] + ".parquet"
+    if not os.path.exists(pq_path) and pl is not None:
+        pl_df = pl.read_excel(path)
+        # Only the sampled rows are converted to pandas
+        return pl_df[sample_positions(pl_df.height, n, seed)].to_pandas()
+    if not os.path.exists(pq_path):
+        df = pd.read_excel(path, engine="openpyxl")
+        return df.iloc[sample_positions(len(df), n, seed)].reset_index(drop=True)
+
+    key_rng = np.random.default_rng(seed)
+    pq_file = pq.ParquetFile(pq_path)
+    keep, keep_keys = None, None
+    for batch in pq_file.iter_batches(batch_size=BATCH_SIZE):
+        chunk = batch.to_pandas()
+        keys = key_rng.random(len(chunk))
+        if keep is not None:
+            chunk = pd.concat([keep, chunk], ignore_index=True)
+            keys = np.concatenate([keep_keys, keys])
+        if len(chunk) > n:
+            idx = np.sort(np.argpartition(keys, n - 1)[:n])
+            chunk, keys = chunk.iloc[idx].reset_index(drop=True), keys[idx]
+        keep, keep_keys = chunk, keys
+    if keep is None:
+        # No batches (empty file): same columns, zero rows, like an empty workbook
+        return pq_file.schema_arrow.empty_table().to_pandas()
+    return keep
 
 # ---------------------------
-# LOAD REAL DATA
+# LOAD REAL DATA (sampled up front: small + safe, and no work on dropped rows)
 # ---------------------------
-df = pd.read_excel(REAL_INPUT_PATH)
+df = load_sample(REAL_INPUT_PATH, N_SAMPLE_ROWS, SEED)
 
 # ---------------------------
 # MASKING RULES (generic + safe)
 # ---------------------------
 
-# 1) Mask ID-like columns
+# Column-name rules; each list is compiled into a single alternation regex.
 # We detect common ID column names; you can add more if needed.
 id_like_patterns = [
     r"\basin\b",
@@ -69,59 +125,74 @@ id_like_patterns = [
     r"\bpo\b.*(id|number)\b",
     r"\border\b.*(id|number)\b",
 ]
-for col in df.columns:
-    col_l = col.lower()
-    if any(re.search(pat, col_l) for pat in id_like_patterns):
-        # choose prefix based on column name
-        prefix = "ID"
-        if "asin" in col_l:
-            prefix = "ASIN"
-        elif "sku" in col_l:
-            prefix = "SKU"
-        elif "po" in col_l:
-            prefix = "PO"
-        elif "order" in col_l:
-            prefix = "ORD"
-        df[col] = mask_id_column(df[col], prefix)
-
-# 2) Shift date-like columns
 date_like_patterns = [r"date", r"week", r"month", r"monday"]
-for col in df.columns:
-    col_l = col.lower()
-    if any(re.search(pat, col_l) for pat in date_like_patterns):
-        # only shift if it looks like a date column
-        try:
-            parsed = pd.to_datetime(df[col], errors="coerce")
-            if parsed.notna().mean() > 0.6:  # mostly parsable dates
-                df[col] = shift_dates(df[col], shift_days=365)
-        except Exception:
-            pass
-
-# 3) Perturb numeric columns (hides exact Franklin numbers)
-num_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-for col in num_cols:
-    df[col] = perturb_numeric(df[col], scale=0.70, noise_pct=0.10)
-    # If it looks like quantity/inventory/demand, ensure nonnegative + round
-    col_l = col.lower()
-    if any(k in col_l for k in ["qty", "quantity", "units", "inventory", "demand", "forecast", "sales", "order"]):
-        df[col] = clamp_nonnegative(df[col]).round(0).astype("Int64")
-
-# 4) Remove super-sensitive columns (optional safety net)
 # If you have columns like "brand", "customer_name", "supplier_name", etc., drop them.
 drop_patterns = [
     r"customer", r"supplier", r"brand", r"company", r"address", r"email", r"phone", r"name"
 ]
-cols_to_drop = []
+ID_RE = re.compile("|".join(id_like_patterns))
+DATE_RE = re.compile("|".join(date_like_patterns))
+DROP_RE = re.compile("|".join(drop_patterns))
+
+# Classify every column once by name
+id_cols, date_cols, cols_to_drop = [], [], []
 for col in df.columns:
     col_l = col.lower()
-    if any(re.search(pat, col_l) for pat in drop_patterns):
+    if ID_RE.search(col_l):
+        id_cols.append(col)
+    if DATE_RE.search(col_l):
+        date_cols.append(col)
+    if DROP_RE.search(col_l):
         cols_to_drop.append(col)
+
+# 1) Remove super-sensitive columns (optional safety net)
+# Done before masking so no hashing/perturbing is spent on columns we discard.
 # comment out next line if you prefer to keep these masked instead
-df = df.drop(columns=cols_to_drop, errors="ignore")
+df = df.loc[:, ~df.columns.isin(cols_to_drop)]
+id_cols = [col for col in id_cols if col in df.columns]
+date_cols = [col for col in date_cols if col in df.columns]
 
-# 5) Sample a small slice (safer + faster for Streamlit)
-if len(df) > N_SAMPLE_ROWS:
-    df = df.sample(n=N_SAMPLE_ROWS, random_state=SEED).reset_index(drop=True)
+# 2) Mask ID-like columns
+for col in id_cols:
+    col_l = col.lower()
+    # choose prefix based on column name
+    prefix = "ID"
+    if "asin" in col_l:
+        prefix = "ASIN"
+    elif "sku" in col_l:
+        prefix = "SKU"
+    elif "po" in col_l:
+        prefix = "PO"
+    elif "order" in col_l:
+        prefix = "ORD"
+    df[col] = mask_id_column(df[col], prefix)
+
+# 3) Shift date-like columns
+for col in date_cols:
+    # only shift if it looks like a date column
+    try:
+        parsed = pd.to_datetime(df[col], errors="coerce")
+        if parsed.notna().mean() > 0.6:  # mostly parsable dates
+            df[col] = shift_dates(df[col], shift_days=365)
+    except Exception:
+        pass
+
+# 4) Perturb numeric columns (hides exact Franklin numbers)
+num_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+if num_cols:
+    num_values = (
+        df[num_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    )
+    num_values = perturb_numeric(num_values, rng, scale=0.70, noise_pct=0.10)
+    # If it looks like quantity/inventory/demand, ensure nonnegative + round
+    quantity_keywords = ["qty", "quantity", "units", "inventory", "demand", "forecast", "sales", "order"]
+    quant_mask = np.array([any(k in col.lower() for k in quantity_keywords) for col in num_cols])
+    num_values[:, quant_mask] = np.clip(num_values[:, quant_mask], 0, None).round()
+
+    num_df = pd.DataFrame(num_values, columns=num_cols, index=df.index)
+    quant_cols = [col for col, is_quant in zip(num_cols, quant_mask) if is_quant]
+    num_df[quant_cols] = num_df[quant_cols].astype("Int64")
+    df[num_cols] = num_df
 
 # ---------------------------
 # SAVE MASKED DATA
@@ -130,5 +201,13 @@ os.makedirs(OUT_DIR, exist_ok=True)
 out_path = os.path.join(OUT_DIR, OUT_FILE)
 df.to_csv(out_path, index=False)
 
-print("✅ Masked sample saved to:", out_path)
+# Parquet copy: typed + columnar, so the app skips CSV parsing on startup.
+# String columns become categoricals (dictionary-encoded on disk).
+pq_df = df.copy()
+str_cols = pq_df.select_dtypes(include=["object", "string"]).columns
+pq_df[str_cols] = pq_df[str_cols].astype("category")
+pq_path = os.path.join(OUT_DIR, OUT_PARQUET_FILE)
+pq_df.to_parquet(pq_path, engine="pyarrow", compression="zstd", index=False)
+
+print("✅ Masked sample saved to:", out_path, "and", pq_path)
 print("Rows:", len(df), "| Cols:", len(df.columns))
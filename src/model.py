@@ -1,19 +1,147 @@
 from dataclasses import dataclass
+from statistics import NormalDist
 import numpy as np
 import pandas as pd
 
+try:
+    from numba import njit
+
+    _HAS_NUMBA = True
+except ImportError:  # numba is optional; fall back to the NumPy path
+    _HAS_NUMBA = False
+
 
 # =========================
 # Simulation parameters
 # =========================
 @dataclass
 class SimParams:
-    forecast_horizon_weeks: int
+    horizon_weeks: int
     lead_time_weeks: int
     review_period_weeks: int
     service_level: float
-    safety_stock_factor: float
-    n_simulations: int
+    safety_factor: float
+    num_sims: int
+    seed: int = 42
+    noise_model: str = "poisson"  # "poisson" or "normal" (faster Normal approximation)
+
+
+_NOISE_MODELS = ("poisson", "normal")
+
+
+# =========================
+# Helpers
+# =========================
+_STD_NORMAL = NormalDist()
+
+
+def _z_from_service_level(sl: float) -> float:
+    """z-score for a cycle service level (inverse normal CDF, Wichura AS241 in the stdlib)."""
+    if not 0.0 < sl < 1.0:
+        raise ValueError(f"service_level must be in (0, 1), got {sl!r}.")
+    return _STD_NORMAL.inv_cdf(sl)
+
+
+def _demand_series(df_asin: pd.DataFrame, demand_col: str, horizon: int) -> np.ndarray:
+    """Weekly demand forecast for the horizon, padded with the mean if the ASIN has fewer rows."""
+    demand = pd.to_numeric(df_asin[demand_col], errors="coerce").dropna().to_numpy(dtype=np.float64)
+    if demand.size == 0:
+        raise ValueError(f"No usable '{demand_col}' values for this ASIN.")
+    if demand.size < horizon:
+        demand = np.concatenate([demand, np.full(horizon - demand.size, demand.mean())])
+    return np.maximum(demand[:horizon], 0.0)
+
+
+# =========================
+# Monte Carlo backends
+# =========================
+def _draw_demand(rng, demand_series, num_sims, normal_noise):
+    """Draw the full (num_sims, horizon) demand matrix in one RNG call."""
+    size = (num_sims, demand_series.size)
+    if not normal_noise:
+        return rng.poisson(lam=demand_series, size=size)
+    # Normal(lam, sqrt(lam)) approximation of Poisson, clipped at zero
+    demand_mat = rng.normal(loc=demand_series, scale=np.sqrt(np.maximum(demand_series, 1.0)), size=size)
+    np.maximum(demand_mat, 0, out=demand_mat)
+    return demand_mat
+
+
+def _simulate_vectorized(demand_series, initial_onhand, order_up_to, lead, review, horizon, num_sims, seed, normal_noise):
+    """Step all sims together week by week with NumPy array ops."""
+    rng = np.random.default_rng(seed)
+    demand_mat = _draw_demand(rng, demand_series, num_sims, normal_noise)
+
+    onhand = np.full(num_sims, initial_onhand)
+    # Arrival buffer indexed by absolute week, plus its running open-order total per sim
+    pipeline = np.zeros((num_sims, horizon + lead + 1))
+    pipeline_running_sum = np.zeros(num_sims)
+    inv_paths = np.zeros((num_sims, horizon))
+    stockout_flags = np.zeros(num_sims, dtype=bool)
+    first_order_qtys = np.zeros(num_sims)
+
+    for t in range(horizon):
+        onhand += pipeline[:, t]
+        pipeline_running_sum -= pipeline[:, t]
+        onhand -= demand_mat[:, t]
+        stockout_flags |= onhand < 0
+        np.maximum(onhand, 0, out=onhand)
+
+        if t % review == 0:
+            inv_pos = onhand + pipeline_running_sum
+            qty = np.maximum(0.0, order_up_to - inv_pos)
+            pipeline[:, t + lead] += qty
+            pipeline_running_sum += qty
+            if t == 0:
+                first_order_qtys = qty.copy()
+
+        inv_paths[:, t] = onhand
+
+    return inv_paths, stockout_flags, first_order_qtys
+
+
+if _HAS_NUMBA:
+
+    # Serial on purpose: Streamlit calls this from a thread per session. With
+    # parallel=True, Numba's workqueue threading layer (the fallback when TBB and
+    # OpenMP are unavailable) is not threadsafe and aborts the process on
+    # concurrent entry. TBB handles it, but 1000 sims x 52 weeks takes
+    # milliseconds serially, so prange isn't worth depending on a specific layer.
+    @njit(cache=True, fastmath=True)
+    def _simulate_kernel(demand_series, initial_onhand, order_up_to, lead, review, horizon, num_sims, seed, normal_noise):
+        """Compiled kernel: each sim is a tight scalar week loop."""
+        inv_paths = np.zeros((num_sims, horizon))
+        stockout_flags = np.zeros(num_sims, dtype=np.bool_)
+        first_order_qtys = np.zeros(num_sims)
+
+        np.random.seed(seed)
+        for s in range(num_sims):
+            pipeline = np.zeros(horizon + lead + 1)
+            pipeline_total = 0.0
+            onhand = initial_onhand
+
+            for t in range(horizon):
+                onhand += pipeline[t]
+                pipeline_total -= pipeline[t]
+                lam = demand_series[t]
+                if normal_noise:
+                    onhand -= max(np.random.normal(lam, np.sqrt(max(lam, 1.0))), 0.0)
+                else:
+                    onhand -= np.random.poisson(lam)
+                if onhand < 0:
+                    stockout_flags[s] = True
+                    onhand = 0.0
+
+                if t % review == 0:
+                    inv_pos = onhand + pipeline_total
+                    qty = max(0.0, order_up_to - inv_pos)
+                    pipeline[t + lead] += qty
+                    pipeline_total += qty
+                    if t == 0:
+                        first_order_qtys[s] = qty
+
+                inv_paths[s, t] = onhand
+
+        return inv_paths, stockout_flags, first_order_qtys
 
 
 # =========================
@@ -22,54 +150,77 @@ class SimParams:
 def simulate_inventory_po(
     df_asin: pd.DataFrame,
     params: SimParams,
+    demand_col: str = "forecast_mean",
 ):
     """
-    NDA-safe inventory & PO simulation.
+    NDA-safe periodic-review (order-up-to) inventory & PO simulation.
     Uses masked demand signals only.
-    """
 
-    # --- Basic demand proxy (masked) ---
-    # Use onhand_units as a scale proxy (safe, non-proprietary)
-    avg_weekly_demand = max(df_asin["onhand_units"].mean() / 12, 1)
+    Runs the compiled Numba kernel when numba is installed, otherwise the
+    vectorized NumPy path (the two use different random streams).
+    """
+    # Callers normally pass rows already in week order (the app sorts once at load);
+    # only sort, and only then copy, when they are not.
+    if "start_date_pred" in df_asin.columns and not df_asin["start_date_pred"].is_monotonic_increasing:
+        df_asin = df_asin.sort_values("start_date_pred")
 
-    # --- Monte Carlo demand simulation ---
-    demand_sims = np.random.normal(
-        loc=avg_weekly_demand,
-        scale=avg_weekly_demand * 0.3,
-        size=(params.n_simulations, params.forecast_horizon_weeks),
-    )
-    demand_sims = np.clip(demand_sims, 0, None)
+    horizon = int(params.horizon_weeks)
+    lead = max(int(params.lead_time_weeks), 1)
+    review = max(int(params.review_period_weeks), 1)
+    num_sims = int(params.num_sims)
+    if params.noise_model not in _NOISE_MODELS:
+        raise ValueError(f"noise_model must be one of {_NOISE_MODELS}, got {params.noise_model!r}.")
 
-    total_demand = demand_sims.sum(axis=1)
+    # Demand is built out to cover the protection period even when it runs past the
+    # displayed horizon, so the horizon slider can't change the PO recommendation.
+    # Only the first `horizon` weeks feed the Monte Carlo and sim_table.
+    protection_weeks = lead + review
+    full_demand = _demand_series(df_asin, demand_col, max(horizon, protection_weeks))
+    demand_series = full_demand[:horizon]
+    onhand0 = pd.to_numeric(df_asin["onhand_units"].iloc[0], errors="coerce")
+    initial_onhand = 0.0 if pd.isna(onhand0) else float(onhand0)
 
-    # --- Safety stock ---
-    z = params.safety_stock_factor
-    safety_stock = z * np.std(total_demand)
+    # --- Order-up-to level ---
+    cumdem = np.concatenate(([0.0], np.cumsum(full_demand)))
 
-    # --- Reorder point ---
-    reorder_point = (
-        avg_weekly_demand * params.lead_time_weeks
-        + safety_stock
-    )
+    def mean_over(weeks: int) -> float:
+        return float(cumdem[weeks])
 
-    # --- Current inventory proxy ---
-    current_inventory = df_asin["onhand_units"].iloc[0]
+    z = _z_from_service_level(params.service_level)
+    protection_demand = mean_over(protection_weeks)
+    # Poisson demand: variance equals the mean over the protection period
+    safety_stock = params.safety_factor * z * np.sqrt(protection_demand)
+    order_up_to = protection_demand + safety_stock
 
-    # --- Recommended PO ---
-    recommended_po = max(
-        reorder_point - current_inventory, 0
+    # --- Monte Carlo ---
+    simulate = _simulate_kernel if _HAS_NUMBA else _simulate_vectorized
+    inv_paths, stockout_flags, first_order_qtys = simulate(
+        demand_series,
+        initial_onhand,
+        order_up_to,
+        lead,
+        review,
+        horizon,
+        num_sims,
+        params.seed,
+        params.noise_model == "normal",
     )
 
-    # --- Weeks of cover ---
-    weeks_of_cover = current_inventory / avg_weekly_demand
-
-    # --- Stockout risk ---
-    stockout_risk = float(
-        np.mean(total_demand > current_inventory)
+    # Floor at 1 unit/week so zero-forecast ASINs get a finite weeks of cover
+    avg_weekly_demand = max(float(demand_series.mean()), 1.0)
+    sim_table = pd.DataFrame(
+        {
+            "week": np.arange(1, horizon + 1),
+            "forecast_demand": demand_series,
+            "avg_onhand": inv_paths.mean(axis=0),
+        }
     )
 
     return {
-        "recommended_po_qty": int(round(recommended_po)),
-        "weeks_of_cover": round(weeks_of_cover, 1),
-        "stockout_risk": round(stockout_risk * 100, 1),
+        "recommended_po_qty": float(first_order_qtys.mean()),
+        "weeks_of_cover": initial_onhand / avg_weekly_demand,
+        "stockout_risk": float(stockout_flags.mean()),
+        "order_up_to": float(order_up_to),
+        "safety_stock": float(safety_stock),
+        "sim_table": sim_table,
     }